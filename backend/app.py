@@ -5,21 +5,63 @@ E-commerce microservice with Flask
 """
 
 import os
+import sys
 import logging
-from datetime import datetime
-from flask import Flask, request, jsonify
+from datetime import datetime, timezone
+from decimal import Decimal
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
+from werkzeug.http import is_resource_modified
 from flask_cors import CORS
+from flask_caching import Cache
+from flask_compress import Compress
 from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+import jwt as pyjwt
+from sqlalchemy import case, event, func, lambda_stmt, select, update
+from sqlalchemy.dialects import mysql
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import selectinload
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 import secrets
+import sqlite3
+import orjson
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, which serializes datetimes natively"""
+
+    option = orjson.OPT_NAIVE_UTC
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, Decimal):
+            # NUMERIC(10, 2) amounts round-trip exactly through a double
+            return float(obj)
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype='application/json'
+        )
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
@@ -27,37 +69,118 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
     'sqlite:///cloudnautic.db'  # Use SQLite for local development
 )
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # Size pool + overflow to the concurrency of a single worker process
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_pre_ping': True,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800))
+    }
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', secrets.token_urlsafe(32))
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_urlsafe(32))
+# SimpleCache is per process, so invalidation only reaches the worker that
+# handled the write; deployments share one RedisCache (see k8s backend-config)
+app.config['CACHE_TYPE'] = os.getenv('CACHE_TYPE', 'SimpleCache')
+app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL')
+app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_ALGORITHM_STREAMING'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 500
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL and relaxed fsyncs for the SQLite database used in development"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')
+    cursor.execute('PRAGMA cache_size=-64000')
+    cursor.close()
+
+# Argon2id tuned to the OWASP minimum (19 MiB, 2 passes) to keep login fast
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+def run_blocking(func, *args):
+    """Run a GIL-releasing C call on a native thread under gevent workers"""
+    if 'gevent.monkey' in sys.modules:
+        from gevent import get_hub
+        from gevent.monkey import is_module_patched
+        if is_module_patched('threading'):
+            return get_hub().threadpool.apply(func, args)
+    return func(*args)
 
 # Initialize extensions
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
+cache = Cache(app)
+Compress(app)
 CORS(app)
 
+# Signing key encoded once at startup rather than on every token issued
+JWT_SIGNING_KEY = app.config['JWT_SECRET_KEY'].encode()
+
+def create_access_token(identity):
+    """Sign an access token accepted by flask_jwt_extended's jwt_required"""
+    now = datetime.now(timezone.utc)
+    return pyjwt.encode({
+        'sub': identity,
+        'type': 'access',
+        'iat': now,
+        'nbf': now,
+        'exp': now + app.config['JWT_ACCESS_TOKEN_EXPIRES']
+    }, JWT_SIGNING_KEY, algorithm=app.config['JWT_ALGORITHM'])
+
 # Database Models
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, index=True, nullable=False)
     password_hash = db.Column(db.String(128))
     name = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=func.now())
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = run_blocking(password_hasher.hash, password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not self.password_hash.startswith('$argon2'):
+            # Accounts registered before the move to argon2 hold Werkzeug hashes
+            return run_blocking(check_password_hash, self.password_hash, password)
+        try:
+            return run_blocking(password_hasher.verify, self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    def needs_rehash(self):
+        return (not self.password_hash.startswith('$argon2')
+                or password_hasher.check_needs_rehash(self.password_hash))
 
 class Product(db.Model):
+    __table_args__ = (
+        db.Index('ix_product_category_id', 'category', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False)
     stock_quantity = db.Column(db.Integer, default=0)
     category = db.Column(db.String(50))
     image_url = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    # Microsecond precision on MySQL too (plain DATETIME rounds to the second),
+    # so updates within the same second still change the ETag. The value comes
+    # from Python rather than server_default=func.now() like created_at, since
+    # NOW() and SQLite's CURRENT_TIMESTAMP only return whole seconds.
+    updated_at = db.Column(
+        db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql'),
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        index=True
+    )
 
     def to_dict(self):
         return {
@@ -68,22 +191,48 @@ class Product(db.Model):
             'stock_quantity': self.stock_quantity,
             'category': self.category,
             'image_url': self.image_url,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at
         }
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    total_amount = db.Column(db.Float, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    total_amount = db.Column(db.Numeric(10, 2), nullable=False)
     status = db.Column(db.String(20), default='pending')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    items = db.relationship('OrderItem', backref='order', lazy='select')
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False)
+
+# Columns returned by product listings, selected without building ORM objects
+PRODUCT_COLS = (
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.price,
+    Product.stock_quantity,
+    Product.category,
+    Product.image_url,
+    Product.created_at
+)
+
+def parse_int(value):
+    """Read an integer from JSON: ints, integral floats and numeric strings"""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    return int(value)
+
+def with_validators(response, etag, last_modified):
+    """Attach the ETag/Last-Modified headers clients revalidate against"""
+    # Weak, so the tag stays valid for both the compressed and plain encodings
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    return response
 
 # Root route
 @app.route('/')
@@ -115,7 +264,7 @@ def health_check():
         db.session.execute(text('SELECT 1'))
         return jsonify({
             'status': 'healthy',
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': datetime.utcnow(),
             'service': 'cloudnautic-backend'
         }), 200
     except Exception as e:
@@ -123,7 +272,7 @@ def health_check():
         return jsonify({
             'status': 'unhealthy',
             'error': str(e),
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': datetime.utcnow()
         }), 500
 
 # Authentication endpoints
@@ -145,7 +294,7 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        access_token = create_access_token(identity=user.id)
+        access_token = create_access_token(identity=str(user.id))
         
         return jsonify({
             'message': 'User registered successfully',
@@ -170,7 +319,11 @@ def login():
         user = User.query.filter_by(email=data['email']).first()
         
         if user and user.check_password(data['password']):
-            access_token = create_access_token(identity=user.id)
+            if user.needs_rehash():
+                user.set_password(data['password'])
+                db.session.commit()
+            
+            access_token = create_access_token(identity=str(user.id))
             return jsonify({
                 'access_token': access_token,
                 'user': {
@@ -192,29 +345,63 @@ def get_products():
     """Get all products with optional filtering"""
     try:
         category = request.args.get('category')
-        page = int(request.args.get('page', 1))
-        per_page = int(request.args.get('per_page', 20))
+        after_id = int(request.args.get('after_id', 0))
+        # Bound the page size so LIMIT stays valid and memory per request is capped
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
         
-        query = Product.query
+        if after_id < 0:
+            return jsonify({'error': 'after_id must not be negative'}), 400
         
+        # Any insert, update or delete in the listed set changes the row count or
+        # the newest updated_at, so together they validate every page of it
+        stats = select(func.count(), func.max(Product.updated_at))
         if category:
-            query = query.filter_by(category=category)
+            stats = stats.where(Product.category == category)
+        total, last_modified = db.session.execute(stats).one()
+        etag = f"{total}-{last_modified.timestamp() if last_modified else 0}"
         
-        products = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return with_validators(Response(status=304), etag, last_modified)
         
-        return jsonify({
-            'products': [product.to_dict() for product in products.items],
-            'pagination': {
-                'page': page,
+        # Keyset pagination: seek past the last id seen instead of OFFSET/COUNT
+        # lambda_stmt caches the compiled SQL per statement shape, so repeat
+        # requests only rebind after_id/category/limit
+        stmt = lambda_stmt(lambda: select(*PRODUCT_COLS).where(Product.id > after_id))
+        
+        if category:
+            stmt += lambda s: s.where(Product.category == category)
+        
+        # Fetch one extra row to find out whether another page exists
+        limit = per_page + 1
+        stmt += lambda s: s.order_by(Product.id).limit(limit)
+        result = db.session.execute(stmt, execution_options={'yield_per': 200}).mappings()
+        
+        def generate():
+            # Serialize row by row so a large page is never held in memory at once
+            has_next = False
+            last_id = None
+            try:
+                yield b'{"products":['
+                for count, row in enumerate(result):
+                    if count == per_page:
+                        has_next = True
+                        break
+                    yield (b',' if count else b'') + orjson.dumps(
+                        dict(row), default=OrjsonProvider.default, option=OrjsonProvider.option
+                    )
+                    last_id = row['id']
+            finally:
+                result.close()
+            
+            yield b'],"pagination":' + orjson.dumps({
+                'after_id': after_id,
                 'per_page': per_page,
-                'total': products.total,
-                'pages': products.pages
-            }
-        }), 200
+                'has_next': has_next,
+                'next_after_id': last_id if has_next else None
+            }) + b'}'
+        
+        response = Response(stream_with_context(generate()), mimetype='application/json')
+        return with_validators(response, etag, last_modified), 200
         
     except Exception as e:
         logger.error(f"Get products error: {str(e)}")
@@ -225,7 +412,12 @@ def get_product(product_id):
     """Get a specific product by ID"""
     try:
         product = Product.query.get_or_404(product_id)
-        return jsonify(product.to_dict()), 200
+        etag = f"{product.id}-{product.updated_at.timestamp()}"
+        
+        if not is_resource_modified(request.environ, etag=etag, last_modified=product.updated_at):
+            return with_validators(Response(status=304), etag, product.updated_at)
+        
+        return with_validators(jsonify(product.to_dict()), etag, product.updated_at), 200
         
     except Exception as e:
         logger.error(f"Get product error: {str(e)}")
@@ -241,7 +433,7 @@ def create_product():
         product = Product(
             name=data['name'],
             description=data.get('description', ''),
-            price=float(data['price']),
+            price=Decimal(str(data['price'])),
             stock_quantity=int(data.get('stock_quantity', 0)),
             category=data.get('category', ''),
             image_url=data.get('image_url', '')
@@ -249,6 +441,7 @@ def create_product():
         
         db.session.add(product)
         db.session.commit()
+        cache.delete('categories')
         
         return jsonify(product.to_dict()), 201
         
@@ -262,9 +455,28 @@ def create_product():
 def create_order():
     """Create a new order"""
     try:
-        user_id = get_jwt_identity()
+        user_id = int(get_jwt_identity())
         data = request.get_json()
         
+        # Coerce ids/quantities once (clients may send "1"), and total the
+        # quantity per product so repeated cart lines are priced together
+        cart = []
+        quantities = {}
+        for item in data['items']:
+            try:
+                product_id = parse_int(item['product_id'])
+                quantity = parse_int(item['quantity'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Item product_id and quantity must be integers'}), 400
+            if quantity <= 0:
+                return jsonify({'error': 'Item quantity must be a positive integer'}), 400
+            
+            cart.append((product_id, quantity))
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        
+        if not quantities:
+            return jsonify({'error': 'Order must contain at least one item'}), 400
+        
         order = Order(
             user_id=user_id,
             total_amount=0  # Will be calculated
@@ -273,24 +485,48 @@ def create_order():
         db.session.add(order)
         db.session.flush()  # To get order ID
         
-        total_amount = 0
+        # Load every product in the cart with a single query; the database also
+        # sums price * quantity over the cart as a window aggregate
+        line_total = Product.price * case(quantities, value=Product.id)
+        rows = db.session.execute(
+            select(
+                Product.id,
+                Product.name,
+                Product.price,
+                func.sum(line_total).over().label('total_amount')
+            ).where(Product.id.in_(quantities))
+        ).all()
+        products = {row.id: row for row in rows}
         
-        for item in data['items']:
-            product = Product.query.get(item['product_id'])
-            if not product or product.stock_quantity < item['quantity']:
+        order_items = []
+        
+        for product_id, quantity in cart:
+            product = products.get(product_id)
+            if not product:
+                db.session.rollback()
+                return jsonify({'error': f'Product {product_id} not found'}), 400
+            
+            # Check and decrement stock in one statement so concurrent orders can't oversell
+            updated = db.session.execute(
+                update(Product)
+                .where(Product.id == product_id, Product.stock_quantity >= quantity)
+                .values(stock_quantity=Product.stock_quantity - quantity)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not updated:
+                db.session.rollback()
                 return jsonify({'error': f'Insufficient stock for product {product.name}'}), 400
             
-            order_item = OrderItem(
+            order_items.append(dict(
                 order_id=order.id,
-                product_id=item['product_id'],
-                quantity=item['quantity'],
+                product_id=product_id,
+                quantity=quantity,
                 price=product.price
-            )
-            
-            total_amount += product.price * item['quantity']
-            product.stock_quantity -= item['quantity']
-            
-            db.session.add(order_item)
+            ))
+        
+        db.session.bulk_insert_mappings(OrderItem, order_items)
+        
+        total_amount = rows[0].total_amount
         
         order.total_amount = total_amount
         db.session.commit()
@@ -310,14 +546,19 @@ def create_order():
 def get_user_orders():
     """Get user's orders"""
     try:
-        user_id = get_jwt_identity()
-        orders = Order.query.filter_by(user_id=user_id).all()
+        user_id = int(get_jwt_identity())
+        orders = Order.query.options(selectinload(Order.items)).filter_by(user_id=user_id).all()
         
         return jsonify([{
             'id': order.id,
             'total_amount': order.total_amount,
             'status': order.status,
-            'created_at': order.created_at.isoformat()
+            'created_at': order.created_at,
+            'items': [{
+                'product_id': item.product_id,
+                'quantity': item.quantity,
+                'price': item.price
+            } for item in order.items]
         } for order in orders]), 200
         
     except Exception as e:
@@ -326,6 +567,7 @@ def get_user_orders():
 
 # Categories endpoint
 @app.route('/api/categories', methods=['GET'])
+@cache.cached(key_prefix='categories', response_filter=lambda rv: rv[1] == 200)
 def get_categories():
     """Get all product categories"""
     try:
@@ -347,7 +589,7 @@ def init_db():
     
     # Sample products
     sample_products = [
-        Product(
+        dict(
             name="MacBook Pro 16\"",
             description="Apple MacBook Pro with M2 Pro chip",
             price=2499.99,
@@ -355,7 +597,7 @@ def init_db():
             category="Electronics",
             image_url="https://via.placeholder.com/300x300?text=MacBook"
         ),
-        Product(
+        dict(
             name="iPhone 15 Pro",
             description="Latest iPhone with titanium design",
             price=999.99,
@@ -363,7 +605,7 @@ def init_db():
             category="Electronics",
             image_url="https://via.placeholder.com/300x300?text=iPhone"
         ),
-        Product(
+        dict(
             name="Nike Air Max",
             description="Comfortable running shoes",
             price=129.99,
@@ -371,7 +613,7 @@ def init_db():
             category="Shoes",
             image_url="https://via.placeholder.com/300x300?text=Nike"
         ),
-        Product(
+        dict(
             name="Gaming Chair",
             description="Ergonomic gaming chair with RGB lighting",
             price=299.99,
@@ -379,7 +621,7 @@ def init_db():
             category="Furniture",
             image_url="https://via.placeholder.com/300x300?text=Chair"
         ),
-        Product(
+        dict(
             name="Wireless Headphones",
             description="Premium noise-cancelling headphones",
             price=199.99,
@@ -389,15 +631,12 @@ def init_db():
         )
     ]
     
-    for product in sample_products:
-        db.session.add(product)
+    db.session.bulk_insert_mappings(Product, sample_products)
     
     db.session.commit()
     logger.info("Database initialized with sample data")
 
-if __name__ == '__main__':
-    with app.app_context():
-        init_db()
-    
-    port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=os.getenv('FLASK_ENV') == 'development')
\ No newline at end of file
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables and load sample data (flask --app app init-db)"""
+    init_db()
@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration for Cloudnautic Shop Backend API
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# gevent workers serve many concurrent requests each, so a few per container is
+# enough. The default is fixed rather than derived from cpu_count(), which sees
+# the node's cores instead of the pod's CPU limit. Every worker keeps its own
+# SQLAlchemy pool (DB_POOL_SIZE + DB_MAX_OVERFLOW); size the three together.
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_class = 'gevent'
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+keepalive = 5
+timeout = 120
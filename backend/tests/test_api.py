@@ -7,29 +7,48 @@ import unittest
 import json
 import os
 import sys
+from werkzeug.security import generate_password_hash
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import app, db, User, Product
+# The engine is created when app is imported, so the test database has to be
+# chosen before then; CI overrides DATABASE_URL to run against MySQL.
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import app, db, cache, User, Product
 
 class CloudnauticAPITest(unittest.TestCase):
     
+    @classmethod
+    def setUpClass(cls):
+        """Create the schema once for every test in the class"""
+        app.config['TESTING'] = True
+        
+        with app.app_context():
+            db.create_all()
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Drop the schema"""
+        with app.app_context():
+            db.drop_all()
+    
     def setUp(self):
         """Set up test environment"""
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         self.app = app.test_client()
         
         with app.app_context():
-            db.create_all()
+            cache.clear()
             self.create_test_data()
     
     def tearDown(self):
         """Clean up after tests"""
         with app.app_context():
             db.session.remove()
-            db.drop_all()
+            for table in reversed(db.metadata.sorted_tables):
+                db.session.execute(table.delete())
+            db.session.commit()
     
     def create_test_data(self):
         """Create test data"""
@@ -52,6 +71,10 @@ class CloudnauticAPITest(unittest.TestCase):
         db.session.add(product1)
         db.session.add(product2)
         db.session.commit()
+        
+        # Ids keep counting across tests on databases that don't reuse them
+        self.laptop_id = product1.id
+        self.phone_id = product2.id
     
     def test_health_check(self):
         """Test health check endpoint"""
@@ -72,15 +95,70 @@ class CloudnauticAPITest(unittest.TestCase):
         self.assertIn('pagination', data)
         self.assertEqual(len(data['products']), 2)
     
+    def test_get_products_keyset_pagination(self):
+        """Test paging through products with after_id"""
+        response = self.app.get('/api/products?per_page=1')
+        data = json.loads(response.data)
+        self.assertEqual(len(data['products']), 1)
+        self.assertTrue(data['pagination']['has_next'])
+        
+        after_id = data['pagination']['next_after_id']
+        response = self.app.get(f'/api/products?per_page=1&after_id={after_id}')
+        data = json.loads(response.data)
+        self.assertEqual(data['products'][0]['name'], 'Test Phone')
+        self.assertFalse(data['pagination']['has_next'])
+    
+    def test_get_products_invalid_pagination(self):
+        """Test that out-of-range pagination parameters are handled"""
+        for per_page in [-5, 0]:
+            response = self.app.get(f'/api/products?per_page={per_page}')
+            self.assertEqual(response.status_code, 200)
+            
+            data = json.loads(response.data)
+            self.assertEqual(data['pagination']['per_page'], 1)
+            self.assertEqual(len(data['products']), 1)
+            self.assertEqual(data['pagination']['next_after_id'], self.laptop_id)
+        
+        response = self.app.get('/api/products?after_id=-1')
+        self.assertEqual(response.status_code, 400)
+    
     def test_get_product_by_id(self):
         """Test get specific product endpoint"""
-        response = self.app.get('/api/products/1')
+        response = self.app.get(f'/api/products/{self.laptop_id}')
         self.assertEqual(response.status_code, 200)
         
         data = json.loads(response.data)
         self.assertEqual(data['name'], 'Test Laptop')
         self.assertEqual(data['price'], 999.99)
     
+    def test_get_products_not_modified(self):
+        """Test conditional product requests with If-None-Match"""
+        response = self.app.get('/api/products')
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        
+        response = self.app.get('/api/products', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        
+        response = self.app.get(f'/api/products/{self.laptop_id}')
+        response = self.app.get(f'/api/products/{self.laptop_id}',
+                              headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        
+        order_data = {
+            'items': [
+                {'product_id': self.laptop_id, 'quantity': 1}
+            ]
+        }
+        
+        self.app.post('/api/orders',
+                     data=json.dumps(order_data),
+                     content_type='application/json',
+                     headers=self.get_auth_headers())
+        
+        response = self.app.get('/api/products', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+    
     def test_get_nonexistent_product(self):
         """Test get non-existent product"""
         response = self.app.get('/api/products/999')
@@ -94,6 +172,26 @@ class CloudnauticAPITest(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('Electronics', data)
     
+    def test_create_product_refreshes_categories(self):
+        """Test that creating a product invalidates cached categories"""
+        self.app.get('/api/categories')
+        
+        product_data = {
+            'name': 'Test Desk',
+            'price': 149.99,
+            'category': 'Furniture'
+        }
+        
+        response = self.app.post('/api/products',
+                               data=json.dumps(product_data),
+                               content_type='application/json',
+                               headers=self.get_auth_headers())
+        self.assertEqual(response.status_code, 201)
+        
+        response = self.app.get('/api/categories')
+        data = json.loads(response.data)
+        self.assertIn('Furniture', data)
+    
     def test_user_registration(self):
         """Test user registration"""
         user_data = {
@@ -140,6 +238,30 @@ class CloudnauticAPITest(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('access_token', data)
     
+    def test_login_upgrades_legacy_password_hash(self):
+        """Test that a Werkzeug password hash is replaced on login"""
+        with app.app_context():
+            user = User(email='legacy@example.com', name='Legacy User',
+                        password_hash=generate_password_hash('testpass123'))
+            db.session.add(user)
+            db.session.commit()
+        
+        login_data = {
+            'email': 'legacy@example.com',
+            'password': 'testpass123'
+        }
+        
+        response = self.app.post('/api/auth/login',
+                               data=json.dumps(login_data),
+                               content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        
+        with app.app_context():
+            user = User.query.filter_by(email='legacy@example.com').first()
+            self.assertTrue(user.password_hash.startswith('$argon2'))
+            self.assertTrue(user.check_password('testpass123'))
+    
     def test_invalid_login(self):
         """Test invalid login credentials"""
         login_data = {
@@ -155,6 +277,170 @@ class CloudnauticAPITest(unittest.TestCase):
         
         data = json.loads(response.data)
         self.assertIn('error', data)
+    
+    def get_auth_headers(self):
+        """Register a user and return authorization headers"""
+        user_data = {
+            'name': 'Test User',
+            'email': 'buyer@example.com',
+            'password': 'testpass123'
+        }
+        
+        response = self.app.post('/api/auth/register',
+                               data=json.dumps(user_data),
+                               content_type='application/json')
+        
+        token = json.loads(response.data)['access_token']
+        return {'Authorization': f'Bearer {token}'}
+    
+    def test_create_order(self):
+        """Test order creation with multiple items"""
+        order_data = {
+            'items': [
+                {'product_id': self.laptop_id, 'quantity': 2},
+                {'product_id': self.phone_id, 'quantity': 1}
+            ]
+        }
+        
+        response = self.app.post('/api/orders',
+                               data=json.dumps(order_data),
+                               content_type='application/json',
+                               headers=self.get_auth_headers())
+        
+        self.assertEqual(response.status_code, 201)
+        
+        data = json.loads(response.data)
+        self.assertAlmostEqual(data['total_amount'], 999.99 * 2 + 599.99)
+        
+        with app.app_context():
+            self.assertEqual(db.session.get(Product, self.laptop_id).stock_quantity, 8)
+            self.assertEqual(db.session.get(Product, self.phone_id).stock_quantity, 4)
+    
+    def test_create_order_repeated_product(self):
+        """Test that repeated cart lines for a product are all charged"""
+        order_data = {
+            'items': [
+                {'product_id': self.phone_id, 'quantity': 1},
+                {'product_id': self.phone_id, 'quantity': 2}
+            ]
+        }
+        
+        response = self.app.post('/api/orders',
+                               data=json.dumps(order_data),
+                               content_type='application/json',
+                               headers=self.get_auth_headers())
+        
+        self.assertEqual(response.status_code, 201)
+        
+        data = json.loads(response.data)
+        self.assertAlmostEqual(data['total_amount'], 599.99 * 3)
+    
+    def test_create_order_accepts_string_ids(self):
+        """Test that numeric strings and integral floats are accepted as integers"""
+        order_data = {
+            'items': [
+                {'product_id': str(self.phone_id), 'quantity': '2'},
+                {'product_id': float(self.phone_id), 'quantity': 1.0}
+            ]
+        }
+        
+        response = self.app.post('/api/orders',
+                               data=json.dumps(order_data),
+                               content_type='application/json',
+                               headers=self.get_auth_headers())
+        
+        self.assertEqual(response.status_code, 201)
+        
+        with app.app_context():
+            self.assertEqual(db.session.get(Product, self.phone_id).stock_quantity, 2)
+    
+    def test_create_order_insufficient_stock(self):
+        """Test order creation with more items than in stock"""
+        order_data = {
+            'items': [
+                {'product_id': self.phone_id, 'quantity': 6}
+            ]
+        }
+        
+        response = self.app.post('/api/orders',
+                               data=json.dumps(order_data),
+                               content_type='application/json',
+                               headers=self.get_auth_headers())
+        
+        self.assertEqual(response.status_code, 400)
+        
+        with app.app_context():
+            self.assertEqual(db.session.get(Product, self.phone_id).stock_quantity, 5)
+    
+    def test_create_order_rejects_non_positive_quantity(self):
+        """Test that invalid ids and quantities are rejected, not coerced"""
+        headers = self.get_auth_headers()
+        
+        invalid_items = [
+            {'product_id': self.laptop_id, 'quantity': -3},
+            {'product_id': self.laptop_id, 'quantity': 0},
+            {'product_id': self.laptop_id, 'quantity': 1.5},
+            {'product_id': self.laptop_id, 'quantity': True},
+            {'product_id': self.laptop_id + 0.7, 'quantity': 1},
+            {'product_id': True, 'quantity': 1}
+        ]
+        
+        for item in invalid_items:
+            order_data = {
+                'items': [item]
+            }
+            
+            response = self.app.post('/api/orders',
+                                   data=json.dumps(order_data),
+                                   content_type='application/json',
+                                   headers=headers)
+            
+            self.assertEqual(response.status_code, 400)
+        
+        with app.app_context():
+            self.assertEqual(db.session.get(Product, self.laptop_id).stock_quantity, 10)
+            self.assertEqual(db.session.get(Product, self.phone_id).stock_quantity, 5)
+    
+    def test_create_order_rolls_back_partial_stock_updates(self):
+        """Test that a failed order leaves stock untouched"""
+        order_data = {
+            'items': [
+                {'product_id': self.phone_id, 'quantity': 3},
+                {'product_id': self.phone_id, 'quantity': 3}
+            ]
+        }
+        
+        response = self.app.post('/api/orders',
+                               data=json.dumps(order_data),
+                               content_type='application/json',
+                               headers=self.get_auth_headers())
+        
+        self.assertEqual(response.status_code, 400)
+        
+        with app.app_context():
+            self.assertEqual(db.session.get(Product, self.phone_id).stock_quantity, 5)
+    
+    def test_get_user_orders(self):
+        """Test listing orders with their items"""
+        headers = self.get_auth_headers()
+        order_data = {
+            'items': [
+                {'product_id': self.laptop_id, 'quantity': 1},
+                {'product_id': self.phone_id, 'quantity': 2}
+            ]
+        }
+        
+        self.app.post('/api/orders',
+                     data=json.dumps(order_data),
+                     content_type='application/json',
+                     headers=headers)
+        
+        response = self.app.get('/api/orders', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        
+        data = json.loads(response.data)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(len(data[0]['items']), 2)
 
 if __name__ == '__main__':
     # Run tests with coverage if available